@@ -1,28 +1,70 @@
+import operator
+import sys
+from functools import lru_cache
+
 class ParseError(Exception):
     pass
 
+# Token opcodes, one byte per token; END terminates every stream
+NUM, ADD, SUB, MUL, DIV, LPAREN, RPAREN, END = range(8)
+_OPCODES = {'+': ADD, '-': SUB, '*': MUL, '/': DIV, '(': LPAREN, ')': RPAREN}
+
+_OPS = {ADD: operator.add, SUB: operator.sub,
+        MUL: operator.mul, DIV: operator.truediv}
+
+# Pads every operator with spaces and turns the ASCII whitespace the
+# grammar allows into ' ', so split(' ') separates all tokens. Any
+# other character stays inside a chunk and is rejected there
+_SPACED = str.maketrans({c: f' {c} ' for c in '+-*/()'} |
+                        {c: ' ' for c in '\t\n\r\f\v'})
+
+def tokenize(text):
+    """
+    Split text into a bytes of opcodes and a parallel list of values:
+    the integer for NUM, the operator character otherwise
+    """
+    opcodes = bytearray()
+    values = []
+    for chunk in filter(None, text.translate(_SPACED).split(' ')):
+        op = _OPCODES.get(chunk)
+        if op is not None:
+            opcodes.append(op)
+            values.append(chunk)
+        elif chunk.isdigit() and chunk.isascii():
+            opcodes.append(NUM)
+            values.append(int(chunk))
+        else:
+            bad = next(c for c in chunk if not '0' <= c <= '9')
+            raise ParseError(f"Unexpected character: {bad}")
+    opcodes.append(END)
+    values.append(None)
+    return bytes(opcodes), values
+
 class Parser:
     """Parser using layering to avoid left recursion"""
+
+    __slots__ = ('opcodes', 'values', 'pos', 'current', '_memo')
     
-    def __init__(self, text):
-        self.text = text
+    def __init__(self, text, memoize=False):
+        self.opcodes, self.values = tokenize(text)
         self.pos = 0
-        self.current = self.text[0] if text else None
+        self.current = self.opcodes[0]
+        # Packrat memo for factor; only worth its cost once the grammar
+        # gains a rule that backtracks and re-enters a position
+        self._memo = {} if memoize else None
     
     def advance(self):
+        # Never called on END, so the sentinel keeps this in bounds
         self.pos += 1
-        if self.pos < len(self.text):
-            self.current = self.text[self.pos]
-        else:
-            self.current = None
+        self.current = self.opcodes[self.pos]
     
-    def skip_whitespace(self):
-        while self.current and self.current.isspace():
-            self.advance()
+    def seek(self, pos):
+        """Jump to a token position, e.g. the end of a memoized parse"""
+        self.pos = pos
+        self.current = self.opcodes[pos]
     
     def match(self, expected):
-        """Match and consume a character"""
-        self.skip_whitespace()
+        """Match and consume a token"""
         if self.current == expected:
             self.advance()
             return True
@@ -30,12 +72,11 @@ class Parser:
     
     def number(self):
         """Parse a number"""
-        self.skip_whitespace()
-        result = ''
-        while self.current and self.current.isdigit():
-            result += self.current
+        if self.current == NUM:
+            result = self.values[self.pos]
             self.advance()
-        return int(result) if result else None
+            return result
+        return None
     
     # === LAYERED GRAMMAR ===
     
@@ -43,19 +84,33 @@ class Parser:
         """
         factor ::= number | ( expression )
         Lowest layer - handles atoms
+
+        With memoize=True, packrat-memoized on the start position:
+        re-entering factor at a position already parsed replays the
+        result and end position
         """
-        self.skip_whitespace()
+        memo = self._memo
+        if memo is not None:
+            start = self.pos
+            hit = memo.get(start)
+            if hit is not None:
+                result, end = hit
+                self.seek(end)
+                return result
         
         # Try parenthesized expression
-        if self.current == '(':
+        if self.current == LPAREN:
             self.advance()
             result = self.expression()
-            if not self.match(')'):
+            if not self.match(RPAREN):
                raise ParseError("missing closing parenthesis!")
-            return result
+        else:
+            # Try number
+            result = self.number()
         
-        # Try number
-        return self.number()
+        if memo is not None:
+            memo[start] = (result, self.pos)
+        return result
     
     def term_prime(self, left):
         """
@@ -63,19 +118,11 @@ class Parser:
 
         Continuation for multiplication/division
         """
-        self.skip_whitespace()
-        
-        while self.current in ('*', '/'):
-            op = self.current
+        op = self.current
+        while op == MUL or op == DIV:
             self.advance()
-            right = self.factor()
-            
-            if op == '*':
-                left = left * right
-            else:
-                left = left / right
-
-            self.skip_whitespace()
+            left = _OPS[op](left, self.factor())
+            op = self.current
         
         return left
 
@@ -93,17 +140,11 @@ class Parser:
 
         Continuation for addition/subtraction
         """
-        self.skip_whitespace()
-        
-        while self.current in ('+', '-'):
-            op = self.current
+        op = self.current
+        while op == ADD or op == SUB:
             self.advance()
-            right = self.term()
-            
-            if op == '+':
-                left = left + right
-            else:
-                left = left - right
+            left = _OPS[op](left, self.term())
+            op = self.current
         
         return left
     
@@ -117,8 +158,22 @@ class Parser:
     
     def parse(self):
         return self.expression()
+
+@lru_cache(maxsize=256)
+def _eval(text):
+    """Parse and evaluate text; repeated inputs are answered from the cache"""
+    return Parser(text).parse()
  
 def main():
+    if not sys.stdin.isatty():
+        # Piped input: read it all at once, no prompts
+        for line in sys.stdin.read().splitlines():
+            try:
+                print(_eval(line))
+            except ParseError as e:
+                print(e)
+        return
+    
     while True:
         try:
             # Read
@@ -126,8 +181,7 @@ def main():
             
             # Eval (just echo for now)
             try:
-                p = Parser(user_input)
-                print(p.parse())
+                print(_eval(user_input))
             except ParseError as e:
                 print(e)
             
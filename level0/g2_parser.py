@@ -1,141 +1,254 @@
+import ast
+import operator
+import re
+import sys
+from functools import lru_cache
+
 class ParseError(Exception):
     pass
 
+# Token opcodes, one byte per token; END terminates every stream
+NUM, NAME, ADD, SUB, MUL, DIV, POW, LPAREN, RPAREN, END = range(10)
+_OPCODES = {'+': ADD, '-': SUB, '*': MUL, '/': DIV, '^': POW,
+            '(': LPAREN, ')': RPAREN}
+
+# Pads every operator with spaces and turns the ASCII whitespace the
+# grammar allows into ' ', so split(' ') separates all tokens. Any
+# other character stays inside a chunk and is rejected there
+_SPACED = str.maketrans({c: f' {c} ' for c in '+-*/^()'} |
+                        {c: ' ' for c in '\t\n\r\f\v'})
+
+_NUMBER_START = frozenset('0123456789.')
+
+# Scans a chunk that is not a single token: '2x', '1.2.3', '$'. Always
+# raises or splits it exactly as a whole-text regex sweep would
+_CHUNK = re.compile(r'(\d+\.\d*|\.\d+)|(\d+)|([A-Za-z_]\w*)|(.)', re.ASCII)
+
+def _scan(chunk, opcodes, values):
+    """Tokenize a chunk holding several glued tokens or a bad character"""
+    for m in _CHUNK.finditer(chunk):
+        real, integer, name, bad = m.groups()
+        if real:
+            opcodes.append(NUM)
+            values.append(float(real))
+        elif integer:
+            opcodes.append(NUM)
+            values.append(int(integer))
+        elif name:
+            opcodes.append(NAME)
+            values.append(name)
+        else:
+            raise ParseError(f"Unexpected character: {bad}")
+
+def tokenize(text):
+    """
+    Split text into a bytes of opcodes and a parallel list of values:
+    the int or float for NUM, the identifier for NAME, the operator
+    character otherwise
+    """
+    opcodes = bytearray()
+    values = []
+    for chunk in filter(None, text.translate(_SPACED).split(' ')):
+        op = _OPCODES.get(chunk)
+        if op is not None:
+            opcodes.append(op)
+            values.append(chunk)
+        elif not chunk.isascii():
+            _scan(chunk, opcodes, values)
+        elif chunk[0] in _NUMBER_START:
+            if chunk.isdigit():
+                opcodes.append(NUM)
+                values.append(int(chunk))
+            elif chunk.replace('.', '', 1).isdigit():
+                opcodes.append(NUM)
+                values.append(float(chunk))
+            else:
+                _scan(chunk, opcodes, values)
+        elif chunk.isidentifier():
+            opcodes.append(NAME)
+            values.append(chunk)
+        else:
+            _scan(chunk, opcodes, values)
+    opcodes.append(END)
+    values.append(None)
+    return bytes(opcodes), values
+
+# Binding power of each infix operator, LOWEST first; unary minus
+# binds tighter than all of them
+_PREC = {ADD: 1, SUB: 1, MUL: 2, DIV: 2, POW: 3}
+_UNARY_PREC = 4
+
+_OPS = {'+': operator.add, '-': operator.sub, '*': operator.mul,
+        '/': operator.truediv, '^': operator.pow}
+
+_AST_OPS = {'+': ast.Add, '-': ast.Sub, '*': ast.Mult,
+            '/': ast.Div, '^': ast.Pow}
+
+class Name(str):
+    """An identifier in RPN code, bound to a value by evaluate()'s env"""
+
+    def __repr__(self):
+        return f"Name({str.__repr__(self)})"
+
 class Parser:
+    """Compiles an expression to RPN code for evaluate()"""
+
+    __slots__ = ('opcodes', 'values', 'pos', 'current', 'code')
+
     def __init__(self, text):
-        self.text = text
+        self.opcodes, self.values = tokenize(text)
         self.pos = 0
-        self.current = self.text[0] if text else None
+        self.current = self.opcodes[0]
+        self.code = []
     
     def advance(self):
+        # Never called on END, so the sentinel keeps this in bounds
         self.pos += 1
-        if self.pos < len(self.text):
-            self.current = self.text[self.pos]
-        else:
-            self.current = None
-    
-    def skip_whitespace(self):
-        while self.current and self.current.isspace():
-            self.advance()
+        self.current = self.opcodes[self.pos]
     
     def number(self):
         """Parse integer or float"""
-        self.skip_whitespace()
-        result = ''
-        has_dot = False
-        
-        while self.current and (self.current.isdigit() or self.current == '.'):
-            if self.current == '.':
-                if has_dot:
-                    break
-                has_dot = True
-            result += self.current
+        if self.current == NUM:
+            result = self.values[self.pos]
             self.advance()
-        
-        if not result or result == '.':
-            return None
-        
-        return float(result) if has_dot else int(result)
+            return result
+        return None
     
-    def primary(self):
+    def parse_expr(self, min_prec=1):
         """
-        primary ::= number | ( expression )
-        HIGHEST precedence - atoms
+        Pratt parser for the layered grammar in g2.bnf:
+        parse one prefix operand, then every infix operator whose
+        precedence is at least min_prec
         """
-        self.skip_whitespace()
-        
-        if self.current == '(':
+        # Prefix: ( expression ) | - operand | identifier | number
+        if self.current == LPAREN:
             self.advance()
-            result = self.expression()
-            self.skip_whitespace()
-            if self.current == ')':
+            self.parse_expr()
+            if self.current == RPAREN:
                 self.advance()
-            return result
-        
-        return self.number()
-    
-    def unary(self):
-        """
-        unary ::= - unary | primary
-        Level 4 - unary minus
-        """
-        self.skip_whitespace()
-        
-        if self.current == '-':
+        elif self.current == SUB:
             self.advance()
-            return -self.unary()
-        
-        return self.primary()
-    
-    def exponent(self):
-        """
-        exponent ::= unary (^ exponent)?
-        Level 3 - exponentiation (RIGHT-associative)
-        """
-        left = self.unary()
-        
-        self.skip_whitespace()
-        if self.current == '^':
+            self.parse_expr(_UNARY_PREC)
+            self.code.append('neg')
+        elif self.current == NAME:
+            self.code.append(Name(self.values[self.pos]))
             self.advance()
-            # Right-associative: parse full right side
-            right = self.exponent()
-            return left ** right
-        
-        return left
-    
-    def term(self):
-        """
-        term ::= exponent ((* | /) exponent)*
-        Level 2 - multiplication and division (LEFT-associative)
-        """
-        left = self.exponent()
+        else:
+            value = self.number()
+            if value is None:
+                raise ParseError("Expected a number")
+            self.code.append(value)
         
-        while True:
-            self.skip_whitespace()
+        # Infix: the right operand binds one level tighter than op
+        prec = _PREC.get(self.current, 0)
+        while prec >= min_prec:
+            op = self.values[self.pos]
+            self.advance()
+            self.parse_expr(prec + 1)
             
-            if self.current == '*':
-                self.advance()
-                right = self.exponent()
-                left = left * right
-            elif self.current == '/':
-                self.advance()
-                right = self.exponent()
-                left = left / right
+            if op == '^':
+                # RIGHT-associative: collect the whole a ^ b ^ c chain,
+                # then emit its operators together so they fold
+                # right-to-left: a b c ^ ^
+                count = 1
+                while self.current == POW:
+                    self.advance()
+                    self.parse_expr(prec + 1)
+                    count += 1
+                self.code.extend([op] * count)
             else:
-                break
-        
-        return left
-    
-    def expression(self):
-        """
-        expression ::= term ((+ | -) term)*
-        Level 1 - addition and subtraction (LEFT-associative)
-        LOWEST precedence
-        """
-        left = self.term()
-        
-        while True:
-            self.skip_whitespace()
+                self.code.append(op)
             
-            if self.current == '+':
-                self.advance()
-                right = self.term()
-                left = left + right
-            elif self.current == '-':
-                self.advance()
-                right = self.term()
-                left = left - right
-            else:
-                break
-        
-        return left
+            prec = _PREC.get(self.current, 0)
     
     def parse(self):
-        result = self.expression()
-        self.skip_whitespace()
-        if self.current is not None:
-            raise Exception(f"Unexpected character: {self.current}")
-        return result
+        """Return the RPN code: numbers, Names, binary operators and 'neg'"""
+        self.parse_expr()
+        if self.current != END:
+            raise ParseError(f"Unexpected token: {self.values[self.pos]}")
+        return tuple(self.code)
+
+
+@lru_cache(maxsize=256)
+def compile_expression(text):
+    """Parse text once; repeated inputs reuse the cached RPN code"""
+    return Parser(text).parse()
+
+def evaluate(code, env=None):
+    """
+    Run RPN code on a value stack, looking identifiers up in env.
+    Operators go through the operator module, so binding names to
+    NumPy arrays evaluates the whole expression element-wise
+    """
+    if env is None:
+        env = {}
+    stack = []
+    for op in code:
+        if not isinstance(op, str):
+            stack.append(op)
+        elif op.__class__ is Name:
+            try:
+                stack.append(env[op])
+            except KeyError:
+                raise NameError(f"name '{op}' is not defined") from None
+        elif op == 'neg':
+            stack[-1] = -stack[-1]
+        else:
+            right = stack.pop()
+            stack[-1] = _OPS[op](stack[-1], right)
+    return stack[-1]
+
+# Every node sits at line 1; set per node rather than through the
+# recursive ast.fix_missing_locations so deep trees build iteratively
+_LOC = {'lineno': 1, 'col_offset': 0, 'end_lineno': 1, 'end_col_offset': 0}
+
+def codegen(code):
+    """Translate RPN code into a Python expression AST"""
+    stack = []
+    for op in code:
+        if not isinstance(op, str):
+            stack.append(ast.Constant(op, **_LOC))
+        elif op.__class__ is Name:
+            # env['x'], never a bare Python name: True, None, __debug__
+            # and __builtins__ must not resolve to CPython's own values
+            stack.append(ast.Subscript(ast.Name('env', ast.Load(), **_LOC),
+                                       ast.Constant(str(op), **_LOC),
+                                       ast.Load(), **_LOC))
+        elif op == 'neg':
+            stack[-1] = ast.UnaryOp(ast.USub(), stack[-1], **_LOC)
+        else:
+            right = stack.pop()
+            stack[-1] = ast.BinOp(stack[-1], _AST_OPS[op](), right, **_LOC)
+    return ast.Expression(stack[-1])
+
+@lru_cache(maxsize=256)
+def compile_bytecode(text):
+    """
+    Compile text down to a CPython code object for run_bytecode(),
+    which pays off when one expression is evaluated under many envs.
+    Returns None when the expression nests too deeply for CPython's
+    recursive compiler; evaluate() has no such limit
+    """
+    tree = codegen(compile_expression(text))
+    try:
+        return compile(tree, '<expression>', 'eval')
+    except RecursionError:
+        return None
+
+class _Env(dict):
+    """The env compiled code subscripts; a missing name is a NameError"""
+
+    def __missing__(self, name):
+        raise NameError(f"name '{name}' is not defined")
+
+def run_bytecode(code, env=None):
+    """Run a compile_bytecode() result, looking identifiers up in env"""
+    return eval(code, {'__builtins__': {}, 'env': _Env(env or {})})
+
+@lru_cache(maxsize=256)
+def _eval(text):
+    """Compile and evaluate text; repeated inputs are answered from the cache"""
+    return evaluate(compile_expression(text))
 
 
 def test():
@@ -154,17 +267,80 @@ def test():
         ("10 / 2 / 5", 1.0),                  # Left-associative: (10 / 2) / 5
         ("2 + 3 * 4 - 5 / 2", 11.5),          # Mixed operators
         ("((2 + 3) * 4 - 1) / 3", 6.333),     # Nested parentheses
+        (".5 * 4", 2.0),                      # Leading-dot float
+        ("5. / 2", 2.5),                      # Trailing-dot float
+        (" + ".join(["1"] * 5000), 5000),     # Too deep for compile()
+        (" ^ ".join(["1"] * 5000), 1),        # Long right-associative chain
     ]
  
     print("Expression                           Result    Expected")
     print("-" * 60)
     for expr, expected in tests:
-        parser = Parser(expr)
-        result = parser.parse()
-        status = "pass" if abs(result - expected) < 0.01 else "FAIL"
+        result = _eval(expr)
+        # The compiled bytecode must agree with the stack VM, unless the
+        # expression nests too deeply to compile
+        bytecode = compile_bytecode(expr)
+        bc_result = result if bytecode is None else run_bytecode(bytecode)
+        ok = abs(result - expected) < 0.01 and abs(bc_result - expected) < 0.01
+        status = "pass" if ok else "FAIL"
+        if len(expr) > 30:
+            expr = expr[:26] + " ..."
         print(f"{expr:30} = {result:8.3f}  ({expected:8.3f}) {status}")
+    
+    env = {'x': 3, 'y': 0.5}
+    name_tests = [
+        ("x ^ 2 + 1", 10),
+        ("-x * (x - 1)", -6),
+        ("x / y", 6.0),
+    ]
+    for expr, expected in name_tests:
+        result = run_bytecode(compile_bytecode(expr), env)
+        vm_result = evaluate(compile_expression(expr), env)
+        ok = abs(result - expected) < 0.01 and abs(vm_result - expected) < 0.01
+        status = "pass" if ok else "FAIL"
+        print(f"{expr:30} = {result:8.3f}  ({expected:8.3f}) {status}")
+    
+    # With NumPy, an array bound in env evaluates element-wise: each
+    # RPN operator is one ufunc call over the whole array
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+    if numpy is not None:
+        expr = "x ^ 2 + 1"
+        x = numpy.arange(5.0)
+        expected = x ** 2 + 1
+        results = (evaluate(compile_expression(expr), {'x': x}),
+                   run_bytecode(compile_bytecode(expr), {'x': x}))
+        ok = all(isinstance(r, numpy.ndarray) and numpy.allclose(r, expected)
+                 for r in results)
+        status = "pass" if ok else "FAIL"
+        print(f"{expr + ' (x array)':30} = {'array':>8}  ({'array':>8}) {status}")
+    
+    # Unbound names, including ones CPython reserves, raise NameError
+    # on both paths
+    for expr in ("z + 1", "True", "None", "__debug__", "__builtins__ + 1"):
+        code, bytecode = compile_expression(expr), compile_bytecode(expr)
+        errors = 0
+        for run in (lambda: evaluate(code, env),
+                    lambda: run_bytecode(bytecode, env)):
+            try:
+                run()
+            except NameError:
+                errors += 1
+        status = "pass" if errors == 2 else "FAIL"
+        print(f"{expr:30} = {'NameError':>8}  ({'NameError':>8}) {status}")
 
 def main():
+    if not sys.stdin.isatty():
+        # Piped input: read it all at once, no prompts
+        for line in sys.stdin.read().splitlines():
+            try:
+                print(_eval(line))
+            except (ParseError, NameError) as e:
+                print(e)
+        return
+    
     while True:
         try:
             # Read
@@ -172,9 +348,8 @@ def main():
             
             # Eval (just echo for now)
             try:
-                p = Parser(user_input)
-                print(p.parse())
-            except ParseError as e:
+                print(_eval(user_input))
+            except (ParseError, NameError) as e:
                 print(e)
             
         except KeyboardInterrupt: